@@ -1,11 +1,12 @@
 import streamlit as st
-import pandas as pd
 from utils.code_templates import generate_python_code, generate_r_code
-from utils.database import get_db, Analysis
-import base64
+from utils.analyses import create_analysis
+from utils.database import get_db, get_engine
+from utils.search import index_missing_analyses, search_analyses
 from contextlib import contextmanager
-from sqlalchemy.orm import Session
 import logging
+import time
+from datetime import date
 from sqlalchemy.exc import SQLAlchemyError
 
 # Set up logging
@@ -27,32 +28,82 @@ def get_db_session():
 def save_analysis(config, python_code, r_code, description=""):
     """Save analysis configuration and generated code to database"""
     try:
-        with contextmanager(get_db_session)() as db:
-            analysis = Analysis(
-                config=config,
-                python_code=python_code,
-                r_code=r_code,
-                description=description
-            )
-            db.add(analysis)
-            db.commit()
-            logger.info(f"Analysis saved successfully with ID: {analysis.id}")
-            return analysis.id
+        return create_analysis(config, python_code, r_code, description)
     except SQLAlchemyError as e:
         logger.error(f"Database error while saving analysis: {e}")
         st.error("Failed to save analysis to database. Please try again.")
-        db.rollback()
         raise
     except Exception as e:
         logger.error(f"Unexpected error while saving analysis: {e}")
         st.error("An unexpected error occurred. Please try again.")
         raise
 
-def create_download_link(code, filename):
-    """Create a download link for code files"""
-    b64 = base64.b64encode(code.encode()).decode()
-    href = f'<a href="data:file/text;base64,{b64}" download="{filename}">📥 Download {filename}</a>'
-    return href
+@st.cache_resource
+def init_database():
+    """Create the database engine and backfill the search index once per server process"""
+    engine = get_engine()
+    with contextmanager(get_db_session)() as db:
+        index_missing_analyses(db)
+    return engine
+
+@st.cache_data
+def load_css(path):
+    """Read a stylesheet once instead of on every rerun"""
+    with open(path) as f:
+        return f.read()
+
+@st.cache_data(max_entries=128)
+def generate_code(config):
+    """Generate Python and R code, reusing results for repeated configurations"""
+    return generate_python_code(config), generate_r_code(config)
+
+def create_download_button(code, filename, mime="text/plain"):
+    """Serve a code file through Streamlit's media endpoint instead of an inline data URI"""
+    st.download_button(
+        label=f"📥 Download {filename}",
+        data=code,
+        file_name=filename,
+        mime=mime,
+        key=f"download_{filename}"
+    )
+
+def render_search_sidebar():
+    """Search saved analyses by text and config fields"""
+    with st.sidebar:
+        st.markdown("### 🔎 Search Saved Analyses")
+        query_text = st.text_input("Description or config text", key="search_text")
+        exposure_concept = st.text_input("Exposure code or medication", key="search_exposure")
+        outcome_concept = st.text_input("Outcome code or medication", key="search_outcome")
+        exposure_type = st.selectbox("Exposure type", ["Any", "Condition", "Medication", "Procedure"], key="search_exposure_type")
+        outcome_type = st.selectbox("Outcome type", ["Any", "Condition", "Medication", "Procedure"], key="search_outcome_type")
+
+        if not any([query_text, exposure_concept, outcome_concept]) and exposure_type == outcome_type == "Any":
+            return
+
+        start = time.perf_counter()
+        with contextmanager(get_db_session)() as db:
+            results = [
+                {
+                    "ID": analysis.id,
+                    "Created": analysis.created_at,
+                    "Description": analysis.description,
+                    "Exposure": (analysis.config or {}).get("exposure_var"),
+                    "Outcome": (analysis.config or {}).get("outcome_var"),
+                }
+                for analysis in search_analyses(
+                    db,
+                    query_text=query_text,
+                    exposure_concept=exposure_concept,
+                    outcome_concept=outcome_concept,
+                    exposure_type=None if exposure_type == "Any" else exposure_type.lower(),
+                    outcome_type=None if outcome_type == "Any" else outcome_type.lower()
+                )
+            ]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        st.caption(f"{len(results)} analyses found in {elapsed_ms:.0f} ms")
+        if results:
+            st.dataframe(results, hide_index=True)
 
 def create_input_form():
     st.write("### Configure Analysis Parameters")
@@ -175,9 +226,12 @@ def main():
     )
 
 
+    init_database()
+
     # Custom CSS
-    with open('assets/style.css') as f:
-        st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+    st.markdown(f'<style>{load_css("assets/style.css")}</style>', unsafe_allow_html=True)
+
+    render_search_sidebar()
 
     # Header with emoji and description
     st.markdown("""
@@ -227,6 +281,25 @@ def main():
             st.markdown("### ⚙️ Additional Settings")
             include_visualization = st.checkbox("Include Visualizations", value=True)
             include_advanced_stats = st.checkbox("Include Advanced Statistics", value=True)
+            include_python_analysis = st.checkbox(
+                "Fit Logistic Regression in Python",
+                value=False,
+                help="Fit the univariable and multivariable models on the in-memory data without the R round trip"
+            )
+            use_sample = st.checkbox(
+                "Fast-Iteration Sample",
+                value=False,
+                help="Run every query on the same deterministic subset of persons while developing the analysis"
+            )
+            sample_fraction = st.number_input("Sample Fraction", min_value=0.001, max_value=1.0, value=0.01, step=0.01, format="%.3f")
+            sample_seed = st.number_input("Sample Seed", min_value=0, value=42, step=1)
+
+            st.markdown("### ⏱️ Temporal Cohort")
+            use_temporal = st.checkbox("Require Exposure Before Outcome", value=False)
+            index_date_type = st.selectbox("Index Date", ["First Exposure", "Fixed Date"], key="index_date_type")
+            fixed_index_date = st.date_input("Fixed Index Date", value=date(2018, 1, 1))
+            washout_days = st.number_input("Washout Period (days of prior observation)", min_value=0, value=365, step=30)
+            outcome_window_days = st.number_input("Outcome Window (days after index, 0 = no limit)", min_value=0, value=0, step=30)
 
         description = st.text_area("📝 Analysis Description", placeholder="Enter a description of your analysis...")
         submitted = st.form_submit_button("🚀 Generate Code")
@@ -250,12 +323,19 @@ def main():
                 "smoking": include_smoking
             },
             "include_visualization": include_visualization,
-            "include_advanced_stats": include_advanced_stats
+            "include_advanced_stats": include_advanced_stats,
+            "include_python_analysis": include_python_analysis,
+            "temporal": {
+                "index_date": "first_exposure" if index_date_type == "First Exposure" else fixed_index_date.isoformat(),
+                "washout_days": int(washout_days),
+                "outcome_window_days": int(outcome_window_days) or None
+            } if use_temporal else None,
+            "sample_fraction": float(sample_fraction) if use_sample else None,
+            "sample_seed": int(sample_seed)
         }
 
         # Generate both Python and R code
-        python_code = generate_python_code(config)
-        r_code = generate_r_code(config)
+        python_code, r_code = generate_code(config)
 
         # Save analysis to database
         try:
@@ -270,15 +350,21 @@ def main():
             st.error("Failed to save analysis. Please try again.")
             logger.error(f"Error in main function: {e}")
 
+        # Keep the generated code across reruns triggered by the download buttons
+        st.session_state["generated_code"] = (python_code, r_code)
+
+    if "generated_code" in st.session_state:
+        python_code, r_code = st.session_state["generated_code"]
+
         # Display Python code
         st.markdown("### 🐍 1. Python Code (Data Preparation)")
         st.code(python_code, language="python")
-        st.markdown(create_download_link(python_code, "data_preparation.py"), unsafe_allow_html=True)
+        create_download_button(python_code, "data_preparation.py", mime="text/x-python")
 
         # Display R code
         st.markdown("### 📊 2. R Code (Statistical Analysis)")
         st.code(r_code, language="r")
-        st.markdown(create_download_link(r_code, "statistical_analysis.R"), unsafe_allow_html=True)
+        create_download_button(r_code, "statistical_analysis.R")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
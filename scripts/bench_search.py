@@ -0,0 +1,111 @@
+"""Measure saved-analysis search latency on a large synthetic history.
+
+Fills a throwaway SQLite database with analyses, indexes them through the
+same code path as the app, and times representative searches. The run
+fails if any search's median latency exceeds the budget.
+
+Usage: python scripts/bench_search.py [--analyses N] [--runs N]
+"""
+import argparse
+import logging
+import os
+import pathlib
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+# Median search latency budget, in milliseconds
+SEARCH_BUDGET_MS = 100
+
+DRUGS = ["metformin", "glipizide", "sitagliptin", "atorvastatin", "simvastatin", "lisinopril", "insulin"]
+CONDITIONS = ["diabetes", "cirrhosis", "hypertension", "asthma", "depression", "fatty liver", "kidney disease"]
+CONFOUNDERS = ["age", "sex", "race_ethnicity", "insurance", "income", "education", "smoking"]
+
+def synthetic_config(rng):
+    """Build a config shaped like the ones the app saves"""
+    return {
+        "exposure_var": [rng.randint(1, 5000)],
+        "exposure_type": rng.choice(["condition", "medication", "procedure"]),
+        "outcome_var": [rng.randint(1, 5000)],
+        "outcome_type": rng.choice(["condition", "medication", "procedure"]),
+        "exclusion_var": [],
+        "exclusion_type": None,
+        "confounders": {name: rng.random() < 0.7 for name in CONFOUNDERS},
+        "include_visualization": True,
+        "include_advanced_stats": True,
+    }
+
+def populate(db, count, rng):
+    """Insert and index synthetic analyses in batches"""
+    from utils.database import Analysis
+    from utils.search import index_analysis
+
+    for start in range(0, count, 1000):
+        batch = []
+        for _ in range(min(1000, count - start)):
+            description = f"{rng.choice(DRUGS)} exposure and {rng.choice(CONDITIONS)} outcome, cohort {rng.randint(1, 100)}"
+            batch.append(Analysis(config=synthetic_config(rng), python_code="", r_code="", description=description))
+        db.add_all(batch)
+        db.flush()
+        for analysis in batch:
+            index_analysis(db, analysis)
+        db.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--analyses", type=int, default=50_000, help="number of saved analyses")
+    parser.add_argument("--runs", type=int, default=20, help="timed repetitions per search")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+        return run_searches(args)
+
+def run_searches(args):
+    """Populate the database named by DATABASE_URL and time the searches against it"""
+    from utils.database import get_db, get_engine
+    from utils.search import search_analyses
+    logging.getLogger("utils").setLevel(logging.WARNING)
+
+    db = next(get_db())
+    try:
+        start = time.perf_counter()
+        populate(db, args.analyses, random.Random(0))
+        print(f"Indexed {args.analyses} analyses in {time.perf_counter() - start:.1f} s")
+
+        searches = {
+            "text: metformin": dict(query_text="metformin"),
+            "text prefix: metf liver": dict(query_text="metf liver"),
+            "exposure concept": dict(exposure_concept="1234"),
+            "text + exposure type": dict(query_text="metformin", exposure_type="medication"),
+            "outcome + confounders": dict(outcome_concept="42", confounders=["age", "smoking"]),
+        }
+
+        failures = []
+        print(f"{'search':<28}{'results':>9}{'median ms':>12}{'max ms':>10}")
+        for name, kwargs in searches.items():
+            timings = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                results = search_analyses(db, **kwargs)
+                timings.append((time.perf_counter() - start) * 1000)
+            median = statistics.median(timings)
+            print(f"{name:<28}{len(results):>9}{median:>12.1f}{max(timings):>10.1f}")
+            if median > SEARCH_BUDGET_MS:
+                failures.append(f"{name}: median {median:.1f} ms exceeds budget of {SEARCH_BUDGET_MS} ms")
+    finally:
+        # Release the SQLite file before the temporary directory is removed
+        db.close()
+        get_engine().dispose()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
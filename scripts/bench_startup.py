@@ -0,0 +1,67 @@
+"""Measure cold-start import time of the app modules against a time budget.
+
+Each module is imported in a fresh interpreter from an empty working
+directory, so the numbers reflect what a new container or autoscaled
+replica pays before serving its first request. The run fails if a module
+exceeds its budget or leaves a database behind on import.
+
+Usage: python scripts/bench_startup.py [--runs N]
+"""
+import argparse
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+# Median import time budget per module, in milliseconds
+IMPORT_BUDGET_MS = {
+    "utils.code_templates": 50,
+    "utils.database": 500,
+    "app": 1500,
+}
+
+def measure_import(module, workdir):
+    """Import a module in a fresh interpreter and return the elapsed milliseconds"""
+    snippet = (
+        "import sys, time\n"
+        f"sys.path.insert(0, {str(REPO_ROOT)!r})\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "print((time.perf_counter() - start) * 1000)\n"
+    )
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    env.pop("DATABASE_URL", None)
+    result = subprocess.run(
+        [sys.executable, "-c", snippet],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'module':<24}{'median ms':>12}{'max ms':>10}{'budget ms':>12}")
+    for module, budget in IMPORT_BUDGET_MS.items():
+        with tempfile.TemporaryDirectory() as workdir:
+            timings = [measure_import(module, workdir) for _ in range(args.runs)]
+            if (pathlib.Path(workdir) / "data").exists():
+                failures.append(f"{module}: created the data directory on import")
+
+        median = statistics.median(timings)
+        print(f"{module:<24}{median:>12.1f}{max(timings):>10.1f}{budget:>12}")
+        if median > budget:
+            failures.append(f"{module}: median {median:.1f} ms exceeds budget of {budget} ms")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""Check that the generated ehr CTE returns the same rows as the original one.
+
+The original CTE joined every measurement and condition row to person before
+filtering on the EHR source; the generated one resolves EHR persons once and
+semi-joins them. Both run against the same synthetic CDR tables in SQLite
+and the run fails if their row sets differ.
+
+Usage: python scripts/check_ehr_query.py [--persons N] [--seed N]
+"""
+import argparse
+import os
+import pathlib
+import random
+import re
+import sqlite3
+import sys
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+CDR = "synthetic.cdr"
+
+# The ehr CTE as the Python template generated it before the semi-join rewrite
+ORIGINAL_EHR_CTE = """
+WITH ehr AS (
+    SELECT
+        DISTINCT p.person_id AS PERSON_ID,
+        p.birth_datetime AS DATE_OF_BIRTH,
+        c_race.concept_name AS RACE,
+        c_sex.concept_name AS SEX,
+        c_ethn.concept_name AS ETHNICITY
+    FROM
+        person p
+        LEFT JOIN concept c_race
+            ON p.race_concept_id = c_race.concept_id
+        LEFT JOIN concept c_sex
+            ON p.sex_at_birth_concept_id = c_sex.concept_id
+        LEFT JOIN concept c_ethn
+            ON p.ethnicity_concept_id = c_ethn.concept_id
+    LEFT JOIN measurement as m on p.person_id = m.person_id
+    LEFT JOIN measurement_ext as mm on m.measurement_id = mm.measurement_id
+    WHERE lower(mm.src_id) like 'ehr site%'
+
+    union
+
+    SELECT
+        DISTINCT p.person_id AS PERSON_ID,
+        p.birth_datetime AS DATE_OF_BIRTH,
+        c_race.concept_name AS RACE,
+        c_sex.concept_name AS SEX,
+        c_ethn.concept_name AS ETHNICITY
+    FROM
+        person p
+        LEFT JOIN concept c_race
+            ON p.race_concept_id = c_race.concept_id
+        LEFT JOIN concept c_sex
+            ON p.sex_at_birth_concept_id = c_sex.concept_id
+        LEFT JOIN concept c_ethn
+            ON p.ethnicity_concept_id = c_ethn.concept_id
+    LEFT JOIN condition_occurrence as m on p.person_id = m.person_id
+    LEFT JOIN condition_occurrence_ext as mm on m.condition_occurrence_id = mm.condition_occurrence_id
+    WHERE lower(mm.src_id) like 'ehr site%'
+)
+"""
+
+CONFIG = {
+    "exposure_var": [1],
+    "exposure_type": "condition",
+    "outcome_var": [2],
+    "outcome_type": "condition",
+    "exclusion_var": [],
+    "exclusion_type": None,
+    "confounders": {},
+}
+
+def generated_ehr_cte():
+    """Render the generated ehr_query and keep its WITH clause, with BigQuery-only syntax mapped to SQLite"""
+    from utils.python_templates import get_python_template
+
+    code = get_python_template(CONFIG)
+    start = code.index("ehr_person_sql = ")
+    end = code.index("\nSELECT", code.index("ehr_query = "))
+    os.environ.setdefault("WORKSPACE_CDR", CDR)
+    namespace = {"os": os}
+    exec(code[start:end] + '"""', namespace)
+    cte = re.sub(r"`[\w.-]+\.(\w+)`", r"\1", namespace["ehr_query"])
+    return cte.replace("union distinct", "union")
+
+def build_tables(db, persons, seed):
+    """Create the CDR tables the ehr CTE reads, with a mix of EHR and non-EHR sources"""
+    db.executescript("""
+        CREATE TABLE person(person_id, birth_datetime, race_concept_id, sex_at_birth_concept_id, ethnicity_concept_id);
+        CREATE TABLE concept(concept_id PRIMARY KEY, concept_name);
+        CREATE TABLE measurement(measurement_id, person_id);
+        CREATE TABLE measurement_ext(measurement_id, src_id);
+        CREATE TABLE condition_occurrence(condition_occurrence_id, person_id);
+        CREATE TABLE condition_occurrence_ext(condition_occurrence_id, src_id);
+    """)
+    rng = random.Random(seed)
+    db.executemany("INSERT INTO concept VALUES (?, ?)", [(cid, f"concept {cid}") for cid in range(1, 10)])
+    for person_id in range(1, persons + 1):
+        db.execute("INSERT INTO person VALUES (?, ?, ?, ?, ?)", (
+            person_id,
+            f"19{rng.randint(30, 99)}-01-01",
+            rng.choice([1, 2, 3, None, 99]),
+            rng.choice([4, 5, None]),
+            rng.choice([6, 7, None]),
+        ))
+        for k in range(rng.randint(0, 4)):
+            row_id = person_id * 10 + k
+            db.execute("INSERT INTO measurement VALUES (?, ?)", (row_id, person_id))
+            db.execute("INSERT INTO measurement_ext VALUES (?, ?)",
+                       (row_id, rng.choice(["EHR site 12", "PPI/PM", "ehr SITE 3", None])))
+            db.execute("INSERT INTO condition_occurrence VALUES (?, ?)", (row_id, person_id))
+            db.execute("INSERT INTO condition_occurrence_ext VALUES (?, ?)",
+                       (row_id, rng.choice(["EHR site 1", "participant mediated", None])))
+
+def ehr_rows(db, cte):
+    return sorted(db.execute(cte + "\nSELECT * FROM ehr").fetchall(), key=repr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the original and generated ehr CTEs")
+    parser.add_argument("--persons", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    db = sqlite3.connect(":memory:")
+    build_tables(db, args.persons, args.seed)
+    original = ehr_rows(db, ORIGINAL_EHR_CTE)
+    generated = ehr_rows(db, generated_ehr_cte())
+
+    print(f"original ehr rows:  {len(original)}")
+    print(f"generated ehr rows: {len(generated)}")
+    if original != generated:
+        missing = set(original) - set(generated)
+        extra = set(generated) - set(original)
+        print(f"FAIL: {len(missing)} rows missing and {len(extra)} unexpected rows in the generated CTE")
+        return 1
+    print("Row sets match")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Load-test the code generation service and report throughput and latency.
+
+Starts an in-process server on a free port unless --url is given, then
+sends POST /generate requests from concurrent keep-alive clients. Configs
+are drawn from a fixed set so repeated configs exercise the response
+cache. Before the measured run, --idle-clients connections each send one
+request and then stay open without sending anything, so there are more
+clients than workers; idle connections must not delay the active ones.
+
+Usage: python scripts/load_test.py [--url http://host:port] [--requests N]
+       [--concurrency N] [--distinct-configs N] [--idle-clients N]
+"""
+import argparse
+import http.client
+import json
+import pathlib
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+def make_configs(count, rng):
+    """Build distinct valid configs"""
+    return [
+        {
+            "exposure_var": [rng.randint(1, 10_000_000)],
+            "exposure_type": rng.choice(["condition", "medication", "procedure"]),
+            "outcome_var": [rng.randint(1, 10_000_000)],
+            "outcome_type": rng.choice(["condition", "medication", "procedure"]),
+            "confounders": {"smoking": rng.random() < 0.5},
+        }
+        for _ in range(count)
+    ]
+
+def run_client(host, port, bodies, latencies, errors):
+    """Send requests over one keep-alive connection, recording per-request latency"""
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    for body in bodies:
+        start = time.perf_counter()
+        try:
+            conn.request("POST", "/generate", body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(str(e))
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+        latencies.append((time.perf_counter() - start) * 1000)
+    conn.close()
+
+def open_idle_clients(host, port, count, body):
+    """Open keep-alive connections that send one request and then sit idle"""
+    connections = []
+    for _ in range(count):
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        conn.request("POST", "/generate", body=body, headers={"Content-Type": "application/json"})
+        conn.getresponse().read()
+        connections.append(conn)
+    return connections
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="service to test; starts a local server when omitted")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--distinct-configs", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=16, help="worker pool size of the local server")
+    parser.add_argument("--idle-clients", type=int, default=16,
+                        help="keep-alive connections left idle during the run")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        target = urlparse(args.url)
+        host, port = target.hostname, target.port or 80
+    else:
+        from utils.service import CodeGenerationServer
+        server = CodeGenerationServer(("127.0.0.1", 0), workers=args.workers)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+
+    rng = random.Random(0)
+    configs = [json.dumps({"config": config}) for config in make_configs(args.distinct_configs, rng)]
+    bodies = [rng.choice(configs) for _ in range(args.requests)]
+    per_client = [bodies[i::args.concurrency] for i in range(args.concurrency)]
+
+    idle_clients = open_idle_clients(host, port, args.idle_clients, configs[0])
+
+    latencies, errors = [], []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for chunk in per_client:
+            pool.submit(run_client, host, port, chunk, latencies, errors)
+    elapsed = time.perf_counter() - start
+
+    for conn in idle_clients:
+        conn.close()
+    if server:
+        server.shutdown()
+        server.server_close()
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"requests:     {len(latencies)} ({len(errors)} errors)")
+    print(f"concurrency:  {args.concurrency} ({len(idle_clients)} idle keep-alive clients)")
+    print(f"requests/sec: {len(latencies) / elapsed:.0f}")
+    print(f"p50 latency:  {statistics.median(latencies):.2f} ms")
+    print(f"p99 latency:  {p99:.2f} ms")
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
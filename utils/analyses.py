@@ -0,0 +1,28 @@
+import logging
+from contextlib import contextmanager
+from sqlalchemy.exc import SQLAlchemyError
+from utils.database import get_db, Analysis
+from utils.search import index_analysis
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+def create_analysis(config, python_code, r_code, description=""):
+    """Save an analysis with its search index entries in one transaction and return its ID"""
+    with contextmanager(get_db)() as db:
+        try:
+            analysis = Analysis(
+                config=config,
+                python_code=python_code,
+                r_code=r_code,
+                description=description
+            )
+            db.add(analysis)
+            db.flush()
+            index_analysis(db, analysis)
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            raise
+        logger.info(f"Analysis saved successfully with ID: {analysis.id}")
+        return analysis.id
@@ -1,6 +1,7 @@
 import os
 import logging
-from sqlalchemy import create_engine, Column, Integer, String, JSON, DateTime
+from functools import lru_cache
+from sqlalchemy import create_engine, text, Column, Integer, String, JSON, DateTime, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -10,42 +11,15 @@ import pathlib
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create data directory if it doesn't exist
+# Default location of the SQLite database, created on first use
 data_dir = pathlib.Path("data")
-try:
-    data_dir.mkdir(exist_ok=True)
-    logger.info(f"Data directory confirmed at: {data_dir}")
-except Exception as e:
-    logger.error(f"Failed to create data directory: {e}")
-    raise
-
-# Get database URL from environment variables, default to SQLite
-DATABASE_URL = os.getenv('DATABASE_URL', f'sqlite:///{data_dir}/analyses.db')
-logger.info(f"Using database: {DATABASE_URL}")
-
-# Create SQLAlchemy engine
-try:
-    if DATABASE_URL.startswith("sqlite"):
-        engine = create_engine(
-            DATABASE_URL, 
-            connect_args={"check_same_thread": False}  # Needed for SQLite
-        )
-    else:
-        engine = create_engine(DATABASE_URL)
-    logger.info("Database engine created successfully")
-except Exception as e:
-    logger.error(f"Failed to create database engine: {e}")
-    raise
-
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Create base class for models
 Base = declarative_base()
 
 class CodeTemplate(Base):
     __tablename__ = "code_templates"
-    
+
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True)
     language = Column(String)
@@ -55,7 +29,7 @@ class CodeTemplate(Base):
 
 class Analysis(Base):
     __tablename__ = "analyses"
-    
+
     id = Column(Integer, primary_key=True, index=True)
     config = Column(JSON)
     python_code = Column(String)
@@ -63,17 +37,91 @@ class Analysis(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     description = Column(String)
 
-# Create tables
-try:
-    Base.metadata.create_all(bind=engine)
-    logger.info("Database tables created successfully")
-except Exception as e:
-    logger.error(f"Failed to create database tables: {e}")
-    raise
+class AnalysisSearch(Base):
+    """Searchable fields extracted from an analysis config, one row per analysis"""
+    __tablename__ = "analysis_search"
+
+    analysis_id = Column(Integer, ForeignKey("analyses.id", ondelete="CASCADE"), primary_key=True)
+    exposure_type = Column(String, index=True)
+    outcome_type = Column(String, index=True)
+    search_text = Column(String)
+
+class AnalysisTerm(Base):
+    """Multi-valued config fields (concept codes, confounders) as indexed (field, value) pairs"""
+    __tablename__ = "analysis_terms"
+    __table_args__ = (Index("ix_analysis_terms_field_value", "field", "value", "analysis_id"),)
+
+    id = Column(Integer, primary_key=True)
+    analysis_id = Column(Integer, ForeignKey("analyses.id", ondelete="CASCADE"), index=True)
+    field = Column(String)
+    value = Column(String)
+
+def get_database_url():
+    """Get database URL from environment variables, default to SQLite"""
+    return os.getenv('DATABASE_URL', f'sqlite:///{data_dir}/analyses.db')
+
+def create_search_indexes(engine):
+    """Create the full-text indexes over analysis_search that table metadata cannot express"""
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            # rowid mirrors analyses.id
+            conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS analyses_fts USING fts5(search_text)"))
+        elif engine.dialect.name == "postgresql":
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_analysis_search_fts ON analysis_search "
+                "USING GIN (to_tsvector('english', coalesce(search_text, '')))"
+            ))
+
+@lru_cache(maxsize=None)
+def get_engine():
+    """Create the SQLAlchemy engine and tables on first use and memoize it"""
+    database_url = get_database_url()
+    logger.info(f"Using database: {database_url}")
+
+    try:
+        if database_url.startswith("sqlite"):
+            # Create data directory if it doesn't exist
+            data_dir.mkdir(exist_ok=True)
+            logger.info(f"Data directory confirmed at: {data_dir}")
+            engine = create_engine(
+                database_url,
+                connect_args={"check_same_thread": False}  # Needed for SQLite
+            )
+        else:
+            engine = create_engine(database_url)
+        logger.info("Database engine created successfully")
+    except Exception as e:
+        logger.error(f"Failed to create database engine: {e}")
+        raise
+
+    # Create tables
+    try:
+        Base.metadata.create_all(bind=engine)
+        create_search_indexes(engine)
+        logger.info("Database tables created successfully")
+    except Exception as e:
+        logger.error(f"Failed to create database tables: {e}")
+        engine.dispose()
+        raise
+
+    return engine
+
+@lru_cache(maxsize=None)
+def get_session_factory():
+    """Create the session factory bound to the memoized engine"""
+    return sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+
+def __getattr__(name):
+    """Keep `engine` and `SessionLocal` importable without creating them at import time"""
+    if name == "engine":
+        return get_engine()
+    if name == "SessionLocal":
+        return get_session_factory()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def get_db():
     """Database session generator with error handling"""
-    db = SessionLocal()
+    db = get_session_factory()()
     try:
         logger.debug("Database session created")
         yield db
@@ -1,6 +1,38 @@
+from datetime import date
+
 def get_python_template(config):
     """Generate Python code template for data preparation"""
 
+    sample_fraction = config.get('sample_fraction')
+    sample_seed = int(config.get('sample_seed') or 0)
+    if sample_fraction is not None and not 0 < sample_fraction <= 1:
+        raise ValueError(f"sample_fraction must be in (0, 1], got {sample_fraction}")
+
+    def sample_clause(person_id_column, standalone=False):
+        """Restrict a generated query to the sampled persons when a sample fraction is configured"""
+        if sample_fraction is None:
+            return ""
+        keyword = "\n        WHERE" if standalone else " AND"
+        return f"{keyword} {{person_sample('{person_id_column}')}}"
+
+    def get_sample_code():
+        """Generate the runtime settings and SQL condition for the deterministic person-level sample"""
+        if sample_fraction is None:
+            return ""
+        return f"""
+# Development sample: every query keeps the same hash-selected subset of persons.
+# Set sample_fraction = None to run on the full cohort.
+sample_fraction = {sample_fraction}
+sample_seed = {sample_seed}
+
+def person_sample(person_id_column):
+    '''SQL condition selecting the sampled persons by a seeded fingerprint of person_id'''
+    if sample_fraction is None:
+        return 'TRUE'
+    threshold = round(sample_fraction * 1000000)
+    return f"ABS(MOD(FARM_FINGERPRINT(CONCAT(CAST({{person_id_column}} AS STRING), ':{{sample_seed}}')), 1000000)) < {{threshold}}"
+"""
+
     def get_query_conditions(var_type):
         """Get the appropriate SQL conditions based on variable type"""
         if var_type == 'medication':
@@ -58,7 +90,7 @@ GROUP BY
 {variable_name}_cohort_sql = f\"\"\"
 SELECT DISTINCT person_id
 FROM `{{os.environ['WORKSPACE_CDR']}}.condition_occurrence`
-WHERE condition_source_concept_id IN ({{{variable_name}_concepts_string}})
+WHERE condition_source_concept_id IN ({{{variable_name}_concepts_string}}){sample_clause('person_id')}
 \"\"\"
 """
         else:  # medication
@@ -90,60 +122,307 @@ WHERE
 {variable_name}_cohort_sql = f\"\"\"
 SELECT DISTINCT person_id
 FROM `{{os.environ['WORKSPACE_CDR']}}.drug_exposure`
-WHERE drug_concept_id IN ({{{variable_name}_concepts_string}})
+WHERE drug_concept_id IN ({{{variable_name}_concepts_string}}){sample_clause('person_id')}
 \"\"\"
 """
 
+    def get_logistic_regression_code(confounders):
+        """Generate an in-process logistic regression stage mirroring the R finalfit analysis"""
+        continuous_vars = []
+        categorical_vars = ['var_1']
+        if confounders['age']:
+            continuous_vars.append('age')
+            categorical_vars.append('age_group_code')
+        if confounders['sex']:
+            categorical_vars.append('sex_cat')
+        if confounders['race_ethnicity']:
+            categorical_vars.append('raceethnicity_cat')
+        if confounders['insurance']:
+            categorical_vars.append('insurance_status')
+        if confounders['income']:
+            categorical_vars.append('income_level')
+        if confounders['education']:
+            categorical_vars.append('education_level')
+        if confounders['smoking']:
+            categorical_vars.append('smoking_status')
+
+        return f"""
+# In-process logistic regression of the outcome (var_2) on the exposure (var_1) and confounders
+import warnings
+from scipy import stats
+from scipy.special import expit
+
+continuous_vars = {continuous_vars}
+categorical_vars = {categorical_vars}
+""" + """explanatory_vars = ['var_1'] + continuous_vars + categorical_vars[1:]
+
+def fit_logistic_irls(X, y, max_iter=100, tol=1e-8):
+    '''Fit a logistic regression by iteratively reweighted least squares
+
+    Like R's glm, a column that is a linear combination of the columns before it is
+    aliased: it is left out of the fit and its estimate and standard error are NaN.
+    '''
+    # Column j is aliased when its residual after projecting onto columns 0..j-1 is negligible
+    r_diag = np.abs(np.diag(np.linalg.qr(X, mode='r')))
+    aliased = r_diag <= 1e-7 * np.linalg.norm(X, axis=0)
+    X_fit = X[:, ~aliased]
+
+    beta = np.zeros(X_fit.shape[1])
+    converged = False
+    for _ in range(max_iter):
+        eta = X_fit @ beta
+        mu = expit(eta)
+        w = np.clip(mu * (1 - mu), 1e-10, None)
+        sqrt_w = np.sqrt(w)
+        beta_new = np.linalg.lstsq(X_fit * sqrt_w[:, None], (eta + (y - mu) / w) * sqrt_w, rcond=None)[0]
+        converged = np.max(np.abs(beta_new - beta)) < tol
+        beta = beta_new
+        if converged:
+            break
+    if not converged:
+        warnings.warn(f"logistic regression did not converge in {max_iter} iterations")
+    mu = expit(X_fit @ beta)
+    eps = 10 * np.finfo(float).eps
+    if np.any((mu < eps) | (mu > 1 - eps)):
+        warnings.warn("fitted probabilities numerically 0 or 1 occurred; estimates may be unreliable (separation)")
+    cov = np.linalg.inv((X_fit.T * (mu * (1 - mu))) @ X_fit)
+
+    full_beta = np.full(X.shape[1], np.nan)
+    full_se = np.full(X.shape[1], np.nan)
+    full_beta[~aliased] = beta
+    full_se[~aliased] = np.sqrt(np.diag(cov))
+    return full_beta, full_se, aliased
+
+def design_matrix(df, columns):
+    '''One-hot encode categorical columns against their first level and add an intercept'''
+    parts = [pd.DataFrame({'(Intercept)': 1.0}, index=df.index)]
+    levels = {}
+    for col in columns:
+        if col in continuous_vars:
+            parts.append(df[[col]].astype(float))
+            levels[col] = [None]
+        else:
+            values = df[col].astype('string').fillna('Missing')
+            levels[col] = sorted(values.unique(), key=lambda level: (level == 'Missing', level))
+            dummies = pd.get_dummies(pd.Categorical(values, categories=levels[col]),
+                                     prefix=col, prefix_sep=': ', dtype=float)
+            parts.append(dummies.iloc[:, 1:].set_index(df.index))
+    return pd.concat(parts, axis=1), levels
+
+def odds_ratios(X, y):
+    '''Odds ratios, 95% Wald confidence intervals and p-values for each model term'''
+    beta, se, aliased = fit_logistic_irls(X.to_numpy(), y)
+    if aliased.any():
+        warnings.warn(f"{aliased.sum()} terms not defined because of singularities: "
+                      + ', '.join(X.columns[aliased]))
+    z = stats.norm.ppf(0.975)
+    return pd.DataFrame({
+        'OR': np.exp(beta),
+        'lower': np.exp(beta - z * se),
+        'upper': np.exp(beta + z * se),
+        'p': 2 * stats.norm.sf(np.abs(beta / se)),
+    }, index=X.columns)
+
+def format_or(row):
+    if np.isnan(row['OR']):
+        return 'NA'
+    p_value = 'p<0.001' if row['p'] < 0.001 else f"p={row['p']:.3f}"
+    return f"{row['OR']:.2f} ({row['lower']:.2f}-{row['upper']:.2f}, {p_value})"
+
+analysis_df = ehr_df.dropna(subset=continuous_vars + ['var_2'])
+y = analysis_df['var_2'].to_numpy(dtype=float)
+outcome_levels = [0, 1]
+X_multi, variable_levels = design_matrix(analysis_df, explanatory_vars)
+multivariable = odds_ratios(X_multi, y)
+
+# Build a finalfit-style table: one row per variable level with univariable and multivariable ORs
+table_rows = []
+for col in explanatory_vars:
+    univariable = odds_ratios(design_matrix(analysis_df, [col])[0], y)
+    if col in continuous_vars:
+        summary = analysis_df.groupby('var_2')[col].agg(['mean', 'std']).reindex(outcome_levels)
+        counts = {f"var_2 = {outcome}": f"{summary.loc[outcome, 'mean']:.1f} ({summary.loc[outcome, 'std']:.1f})"
+                  for outcome in outcome_levels}
+        table_rows.append({'label': col, 'levels': 'Mean (SD)', **counts,
+                           'OR (univariable)': format_or(univariable.loc[col]),
+                           'OR (multivariable)': format_or(multivariable.loc[col])})
+        continue
+
+    values = analysis_df[col].astype('string').fillna('Missing')
+    crosstab = pd.crosstab(values, analysis_df['var_2']).reindex(columns=outcome_levels, fill_value=0)
+    percent = crosstab / crosstab.sum(axis=0).replace(0, np.nan) * 100
+    for i, level in enumerate(variable_levels[col]):
+        term = f"{col}: {level}"
+        counts = {f"var_2 = {outcome}": f"{crosstab.loc[level, outcome]} ({percent.loc[level, outcome]:.1f})"
+                  for outcome in outcome_levels}
+        table_rows.append({'label': col if i == 0 else '', 'levels': level, **counts,
+                           'OR (univariable)': '-' if i == 0 else format_or(univariable.loc[term]),
+                           'OR (multivariable)': '-' if i == 0 else format_or(multivariable.loc[term])})
+
+finalfit_table = pd.DataFrame(table_rows)
+print(finalfit_table.to_string(index=False))
+"""
+
+    def get_temporal_cohort_code(temporal_config):
+        """Generate exposure/outcome flags with index dates, washout and outcome windows computed in BigQuery"""
+        index_date = temporal_config.get('index_date', 'first_exposure')
+        if index_date != 'first_exposure':
+            index_date = date.fromisoformat(str(index_date)).isoformat()
+        washout_days = int(temporal_config.get('washout_days', 0))
+        outcome_window_days = temporal_config.get('outcome_window_days')
+        outcome_window_days = int(outcome_window_days) if outcome_window_days else None
+
+        return f"""# Temporal cohort settings
+index_date = '{index_date}'  # 'first_exposure' or a fixed 'YYYY-MM-DD' date
+washout_days = {washout_days}  # Days of observation required before the index date
+outcome_window_days = {outcome_window_days}  # Days after the index date in which the outcome counts (None = no limit)
+""" + f"""
+def create_temporal_query(exposure_ids, outcome_ids):
+    '''Creates a SQL query with first exposure/outcome dates and temporal flags per person'''
+    exposure_ids_str = ', '.join(map(str, exposure_ids)) or 'NULL'
+    outcome_ids_str = ', '.join(map(str, outcome_ids)) or 'NULL'
+    # Unexposed persons have no first exposure, so their index is the first date they meet the washout
+    index_expr = (
+        f"COALESCE(f.exposure_date, DATE_ADD(o.observation_start_date, INTERVAL {{washout_days}} DAY))"
+        if index_date == 'first_exposure' else f"DATE '{{index_date}}'"
+    )
+    window_clause = '' if outcome_window_days is None else \\
+        f"AND outcome_date <= DATE_ADD(index_date, INTERVAL {{outcome_window_days}} DAY)"
+
+    query = f\"\"\"
+    WITH concept_set_events AS (
+        SELECT person_id, 'exposure' AS concept_set, entry_date
+        FROM `{{os.environ['WORKSPACE_CDR']}}.cb_search_all_events`
+        WHERE concept_id IN ({{exposure_ids_str}}){sample_clause('person_id')}
+
+        UNION ALL
+
+        SELECT person_id, 'outcome' AS concept_set, entry_date
+        FROM `{{os.environ['WORKSPACE_CDR']}}.cb_search_all_events`
+        WHERE concept_id IN ({{outcome_ids_str}}){sample_clause('person_id')}
+    ),
+
+    first_dates AS (
+        SELECT
+            person_id,
+            MIN(IF(concept_set = 'exposure', entry_date, NULL)) AS exposure_date,
+            MIN(IF(concept_set = 'outcome', entry_date, NULL)) AS outcome_date
+        FROM concept_set_events
+        GROUP BY person_id
+    ),
+
+    observation_start AS (
+        SELECT person_id, MIN(observation_period_start_date) AS observation_start_date
+        FROM `{{os.environ['WORKSPACE_CDR']}}.observation_period`{sample_clause('person_id', standalone=True)}
+        GROUP BY person_id
+    ),
+
+    indexed AS (
+        SELECT
+            o.person_id,
+            f.exposure_date,
+            f.outcome_date,
+            o.observation_start_date,
+            {{index_expr}} AS index_date
+        FROM observation_start o
+        LEFT JOIN first_dates f ON o.person_id = f.person_id
+    )
+
+    SELECT
+        person_id,
+        exposure_date,
+        outcome_date,
+        index_date,
+        CASE WHEN exposure_date <= index_date THEN 1 ELSE 0 END AS var_1,
+        CASE WHEN outcome_date > index_date {{window_clause}} THEN 1 ELSE 0 END AS var_2,
+        CASE
+            WHEN outcome_date <= index_date THEN 1
+            WHEN DATE_DIFF(index_date, observation_start_date, DAY) < {{washout_days}} THEN 1
+            ELSE 0
+        END AS temporal_exclusion
+    FROM indexed
+    \"\"\"
+    return query
+
+# Fetch first exposure/outcome dates and temporal flags (one row per person with an observation period);
+# the merge below keeps only the EHR persons already in ehr_df, so the _ext tables are not scanned again
+if variable_1 or variable_2:
+    temporal_df = pd.read_gbq(create_temporal_query(variable_1, variable_2), dialect="standard", use_bqstorage_api=True)
+    ehr_df = ehr_df.drop(columns=['var_1', 'var_2']).merge(
+        temporal_df.rename(columns={{'person_id': 'PERSON_ID'}}), on='PERSON_ID', how='left')
+    # A person missing from the temporal result has no known observation start, so exclude them
+    ehr_df['temporal_exclusion'] = ehr_df['temporal_exclusion'].fillna(1).astype(int)
+    ehr_df[['var_1', 'var_2']] = ehr_df[['var_1', 'var_2']].fillna(0).astype(int)
+
+    # Drop persons without an observation start, with an outcome on or before the index date,
+    # or with less than the washout period of observation before the index date
+    ehr_df = ehr_df[ehr_df['temporal_exclusion'] == 0]
+"""
+
     # Format the exposure and outcome variable lists
     exposure_vars = config['exposure_var']
     outcome_vars = config['outcome_var']
     exclusion_vars = config.get('exclusion_var', [])
 
-    code = """import os
+    # Flag exposure and outcome either as "ever had" or with temporal ordering
+    if config.get('temporal'):
+        cohort_flags_code = get_temporal_cohort_code(config['temporal'])
+    else:
+        cohort_flags_code = f"""# Fetch and update cohort for Variable 1 (Exposure)
+if variable_1:
+    query_var_1 = create_cohort_query(variable_1, "{config['exposure_type']}")
+    cohort_var_1_df = pd.read_gbq(query_var_1, dialect="standard", use_bqstorage_api=True)
+    ehr_df.loc[ehr_df['PERSON_ID'].isin(cohort_var_1_df['person_id']), 'var_1'] = 1
+
+# Fetch and update cohort for Variable 2 (Outcome)
+if variable_2:
+    query_var_2 = create_cohort_query(variable_2, "{config['outcome_type']}")
+    cohort_var_2_df = pd.read_gbq(query_var_2, dialect="standard", use_bqstorage_api=True)
+    ehr_df.loc[ehr_df['PERSON_ID'].isin(cohort_var_2_df['person_id']), 'var_2'] = 1
+
+"""
+
+    code = f"""import os
 import pandas as pd
-import subprocess
 import numpy as np
+{get_sample_code()}
+# Persons with at least one EHR-sourced record, resolved once from the _ext tables
+ehr_person_sql = f\"\"\"
+    SELECT m.person_id
+    FROM `{{os.environ['WORKSPACE_CDR']}}.measurement` m
+    JOIN `{{os.environ['WORKSPACE_CDR']}}.measurement_ext` mm
+        ON m.measurement_id = mm.measurement_id
+    WHERE lower(mm.src_id) like 'ehr site%'{sample_clause('m.person_id')}
+
+    union distinct
+
+    SELECT co.person_id
+    FROM `{{os.environ['WORKSPACE_CDR']}}.condition_occurrence` co
+    JOIN `{{os.environ['WORKSPACE_CDR']}}.condition_occurrence_ext` coe
+        ON co.condition_occurrence_id = coe.condition_occurrence_id
+    WHERE lower(coe.src_id) like 'ehr site%'{sample_clause('co.person_id')}
+\"\"\"
 
 # SQL query to fetch EHR data
 ehr_query = f\"\"\"
-WITH ehr AS (
-    SELECT
-        DISTINCT p.person_id AS PERSON_ID,
-        p.birth_datetime AS DATE_OF_BIRTH,
-        c_race.concept_name AS RACE,
-        c_sex.concept_name AS SEX,
-        c_ethn.concept_name AS ETHNICITY
-    FROM
-        `{os.environ['WORKSPACE_CDR']}.person` p
-        LEFT JOIN `{os.environ['WORKSPACE_CDR']}.concept` c_race
-            ON p.race_concept_id = c_race.concept_id
-        LEFT JOIN `{os.environ['WORKSPACE_CDR']}.concept` c_sex
-            ON p.sex_at_birth_concept_id = c_sex.concept_id
-        LEFT JOIN `{os.environ['WORKSPACE_CDR']}.concept` c_ethn
-            ON p.ethnicity_concept_id = c_ethn.concept_id
-    LEFT JOIN `{os.environ['WORKSPACE_CDR']}.measurement` as m on p.person_id = m.person_id
-    LEFT JOIN `{os.environ['WORKSPACE_CDR']}.measurement_ext` as mm on m.measurement_id = mm.measurement_id
-    WHERE lower(mm.src_id) like 'ehr site%'
-
-    union distinct
+WITH ehr_person AS ({{ehr_person_sql}}),
 
+ehr AS (
     SELECT
-        DISTINCT p.person_id AS PERSON_ID,
+        p.person_id AS PERSON_ID,
         p.birth_datetime AS DATE_OF_BIRTH,
         c_race.concept_name AS RACE,
         c_sex.concept_name AS SEX,
         c_ethn.concept_name AS ETHNICITY
     FROM
-        `{os.environ['WORKSPACE_CDR']}.person` p
-        LEFT JOIN `{os.environ['WORKSPACE_CDR']}.concept` c_race
+        `{{os.environ['WORKSPACE_CDR']}}.person` p
+        LEFT JOIN `{{os.environ['WORKSPACE_CDR']}}.concept` c_race
             ON p.race_concept_id = c_race.concept_id
-        LEFT JOIN `{os.environ['WORKSPACE_CDR']}.concept` c_sex
+        LEFT JOIN `{{os.environ['WORKSPACE_CDR']}}.concept` c_sex
             ON p.sex_at_birth_concept_id = c_sex.concept_id
-        LEFT JOIN `{os.environ['WORKSPACE_CDR']}.concept` c_ethn
+        LEFT JOIN `{{os.environ['WORKSPACE_CDR']}}.concept` c_ethn
             ON p.ethnicity_concept_id = c_ethn.concept_id
-    LEFT JOIN `{os.environ['WORKSPACE_CDR']}.condition_occurrence` as m on p.person_id = m.person_id
-    LEFT JOIN `{os.environ['WORKSPACE_CDR']}.condition_occurrence_ext` as mm on m.condition_occurrence_id = mm.condition_occurrence_id
-    WHERE lower(mm.src_id) like 'ehr site%'
+    WHERE p.person_id IN (SELECT person_id FROM ehr_person)
 )
 
 SELECT
@@ -162,36 +441,36 @@ LEFT JOIN (
     SELECT 
         o.person_id, 
         answer.concept_name as aname
-    FROM `{os.environ['WORKSPACE_CDR']}.observation` o
-    LEFT JOIN `{os.environ['WORKSPACE_CDR']}.concept` answer on (answer.concept_id=o.value_source_concept_id)
-    WHERE o.observation_source_concept_id = 1585386
+    FROM `{{os.environ['WORKSPACE_CDR']}}.observation` o
+    LEFT JOIN `{{os.environ['WORKSPACE_CDR']}}.concept` answer on (answer.concept_id=o.value_source_concept_id)
+    WHERE o.observation_source_concept_id = 1585386{sample_clause('o.person_id')}
 ) ins1 ON ehr.PERSON_ID = ins1.person_id
 
 LEFT JOIN (
     SELECT 
         o.person_id, 
         answer.concept_name as aname
-    FROM `{os.environ['WORKSPACE_CDR']}.observation` o
-    LEFT JOIN `{os.environ['WORKSPACE_CDR']}.concept` answer on (answer.concept_id=o.value_source_concept_id)
-    WHERE o.observation_source_concept_id = 1585375
+    FROM `{{os.environ['WORKSPACE_CDR']}}.observation` o
+    LEFT JOIN `{{os.environ['WORKSPACE_CDR']}}.concept` answer on (answer.concept_id=o.value_source_concept_id)
+    WHERE o.observation_source_concept_id = 1585375{sample_clause('o.person_id')}
 ) obs1 ON ehr.PERSON_ID = obs1.person_id
 
 LEFT JOIN (
     SELECT 
         o.person_id, 
         answer.concept_name as aname
-    FROM `{os.environ['WORKSPACE_CDR']}.observation` o
-    LEFT JOIN `{os.environ['WORKSPACE_CDR']}.concept` answer on (answer.concept_id=o.value_source_concept_id)
-    WHERE o.observation_source_concept_id = 1585940
+    FROM `{{os.environ['WORKSPACE_CDR']}}.observation` o
+    LEFT JOIN `{{os.environ['WORKSPACE_CDR']}}.concept` answer on (answer.concept_id=o.value_source_concept_id)
+    WHERE o.observation_source_concept_id = 1585940{sample_clause('o.person_id')}
 ) obs2 ON ehr.PERSON_ID = obs2.person_id
 
 LEFT JOIN (
     SELECT 
         o.person_id, 
         answer.concept_name as aname
-    FROM `{os.environ['WORKSPACE_CDR']}.observation` o
-    LEFT JOIN `{os.environ['WORKSPACE_CDR']}.concept` answer on (answer.concept_id=o.value_source_concept_id)
-    WHERE o.observation_source_concept_id = 1586198
+    FROM `{{os.environ['WORKSPACE_CDR']}}.observation` o
+    LEFT JOIN `{{os.environ['WORKSPACE_CDR']}}.concept` answer on (answer.concept_id=o.value_source_concept_id)
+    WHERE o.observation_source_concept_id = 1586198{sample_clause('o.person_id')}
 ) obs3 ON ehr.PERSON_ID = obs3.person_id
 \"\"\"
 
@@ -337,54 +616,61 @@ def create_cohort_query(concept_ids, var_type):
     query = f\"\"\"
     SELECT DISTINCT person_id 
     FROM `{{os.environ['WORKSPACE_CDR']}}.cb_search_all_events`
-    WHERE concept_id IN ({{concept_ids_str}})
+    WHERE concept_id IN ({{concept_ids_str}}){sample_clause('person_id')}
     \"\"\"
     return query
 
-# Fetch and update cohort for Variable 1 (Exposure)
-if variable_1:
-    query_var_1 = create_cohort_query(variable_1, "{config['exposure_type']}")
-    cohort_var_1_df = pd.read_gbq(query_var_1, dialect="standard", use_bqstorage_api=True)
-    ehr_df.loc[ehr_df['PERSON_ID'].isin(cohort_var_1_df['person_id']), 'var_1'] = 1
-
-# Fetch and update cohort for Variable 2 (Outcome)
-if variable_2:
-    query_var_2 = create_cohort_query(variable_2, "{config['outcome_type']}")
-    cohort_var_2_df = pd.read_gbq(query_var_2, dialect="standard", use_bqstorage_api=True)
-    ehr_df.loc[ehr_df['PERSON_ID'].isin(cohort_var_2_df['person_id']), 'var_2'] = 1
-
-# Apply exclusion criteria if specified
+{cohort_flags_code}# Apply exclusion criteria if specified
 if variable_3:
     query_var_3 = create_cohort_query(variable_3, "{config['exclusion_type']}")
     cohort_var_3_df = pd.read_gbq(query_var_3, dialect="standard", use_bqstorage_api=True)
     ehr_df = ehr_df[~ehr_df['PERSON_ID'].isin(cohort_var_3_df['person_id'])]
 
+def write_bucket_csv(df, bucket_uri, object_name, chunk_size=8 * 1024 * 1024):
+    '''Stream a dataframe as CSV into the bucket without writing a local copy.
+
+    gs:// buckets are written with a chunked resumable upload through the
+    storage client; any other path is treated as a local directory standing
+    in for the bucket, which makes the pipeline testable offline.
+    '''
+    if bucket_uri.startswith("gs://"):
+        from google.cloud import storage
+
+        bucket_name, _, prefix = bucket_uri[len("gs://"):].partition("/")
+        blob_name = f"{{prefix.rstrip('/')}}/{{object_name}}" if prefix else object_name
+        blob = storage.Client().bucket(bucket_name).blob(blob_name)
+        with blob.open("w", chunk_size=chunk_size) as f:
+            df.to_csv(f, index=False)
+    else:
+        path = os.path.join(bucket_uri, object_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_csv(path, index=False)
+    return f"{{bucket_uri.rstrip('/')}}/{{object_name}}"
+
 # Save to Google Bucket
 destination_filename = 'ehr_df.csv'
-ehr_df.to_csv(destination_filename, index=False)
-
-# Copy to Google Bucket
 my_bucket = os.getenv('WORKSPACE_BUCKET')
-args = ["gsutil", "cp", f"./{{destination_filename}}", f"{{my_bucket}}/data/"]
-output = subprocess.run(args, capture_output=True)
+write_bucket_csv(ehr_df, my_bucket, f"data/{{destination_filename}}")
 
 print("Data processing complete and saved to Google Bucket")
 print(f"Exposure Variable ({config['exposure_type'].title()}) SNOMED Codes: {{variable_1}}")
 print(f"Outcome Variable ({config['outcome_type'].title()}) SNOMED Codes: {{variable_2}}")
 if variable_3:
-    print(f"Exclusion Criteria ({config['exclusion_type'].title()}) SNOMED Codes: {{variable_3}}")
+    print(f"Exclusion Criteria ({config['exclusion_type'].title() if config['exclusion_type'] else 'None'}) SNOMED Codes: {{variable_3}}")
 else:
     print("No exclusion criteria specified")
 
-# Add exposure cohort creation
-code += get_cohort_query(config["exposure"], "exposure")
-code += """
+    """
+
+    # Add exposure/outcome cohorts for ICD-code and medication-name configurations
+    if "exposure" in config and "outcome" in config:
+        code += get_cohort_query(config["exposure"], "exposure")
+        code += """
 exposure_cohort_df = pd.read_gbq(exposure_cohort_sql, dialect="standard", use_bqstorage_api=True)
 """
 
-# Add outcome cohort creation
-code += get_cohort_query(config["outcome"], "outcome")
-code += """
+        code += get_cohort_query(config["outcome"], "outcome")
+        code += """
 outcome_cohort_df = pd.read_gbq(outcome_cohort_sql, dialect="standard", use_bqstorage_api=True)
 
 # Add cohort flags to main dataframe
@@ -392,14 +678,14 @@ ehr_df['exposure'] = np.where(ehr_df['PERSON_ID'].isin(exposure_cohort_df['perso
 ehr_df['outcome'] = np.where(ehr_df['PERSON_ID'].isin(outcome_cohort_df['person_id']), 1, 0)
 
 # Save to Google Bucket
-destination_filename = 'ehr_df.csv'
-ehr_df.to_csv(destination_filename, index=False)
-
-my_bucket = os.getenv('WORKSPACE_BUCKET')
-args = ["gsutil", "cp", f"./{{destination_filename}}", f"{{my_bucket}}/data/"]
-output = subprocess.run(args, capture_output=True)
+write_bucket_csv(ehr_df, my_bucket, f"data/{destination_filename}")
 
 print("Data processing complete and saved to Google Bucket")
 """
 
-    return code
\ No newline at end of file
+
+    # Fit the logistic models directly on the in-memory frame
+    if config.get('include_python_analysis'):
+        code += get_logistic_regression_code(config['confounders'])
+
+    return code
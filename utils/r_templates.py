@@ -23,8 +23,13 @@ def get_r_template(config):
 
     # Create the R code template with properly escaped % characters
     code = f"""install.packages("finalfit")
+# Arrow is large, so only install it when the environment does not already have it
+if (!requireNamespace("arrow", quietly = TRUE)) {{
+    install.packages("arrow")
+}}
 library("finalfit")
 library("tidyverse")
+library("arrow")
 
 # This code copies a file from your Google Bucket into a dataframe
 name_of_file_in_bucket <- 'ehr_df.csv'
@@ -38,11 +43,17 @@ name_of_file_in_bucket <- 'ehr_df.csv'
 # Get the bucket name
 my_bucket <- Sys.getenv('WORKSPACE_BUCKET')
 
-# Copy the file from current workspace to the bucket
-system(paste0("gsutil cp ", my_bucket, "/data/", name_of_file_in_bucket, " ."), intern=TRUE)
-
-# Load the file into a dataframe
-ehr_df <- read_csv(name_of_file_in_bucket)
+# Read the object straight from the bucket when Arrow was built with GCS support;
+# otherwise copy it locally first. Every path goes through read_csv_arrow so column
+# types are inferred the same way. Any path other than gs:// is read as a local
+# directory standing in for the bucket.
+bucket_path <- paste0(my_bucket, "/data/", name_of_file_in_bucket)
+if (startsWith(bucket_path, "gs://") && !arrow_with_gcs()) {{
+    local_path <- file.path(tempdir(), name_of_file_in_bucket)
+    system2("gsutil", c("cp", bucket_path, local_path))
+    bucket_path <- local_path
+}}
+ehr_df <- read_csv_arrow(bucket_path)
 head(ehr_df)
 
 # Convert variables to factors
@@ -0,0 +1,141 @@
+import logging
+from sqlalchemy import text, func, select, literal_column, Integer
+from utils.database import Analysis, AnalysisSearch, AnalysisTerm
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Config keys holding concept codes, mapped to the term field they are indexed under
+CONCEPT_FIELDS = {
+    "exposure_var": "exposure_concept",
+    "outcome_var": "outcome_concept",
+    "exclusion_var": "exclusion_concept",
+}
+
+def normalize_term(value):
+    """Normalize a term value so lookups match regardless of case and padding"""
+    return str(value).strip().lower()
+
+def flatten_config(value):
+    """Yield the searchable words of a nested config; enabled flags contribute their name"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if item is True:
+                yield key
+            elif item is not False and item is not None:
+                yield from flatten_config(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from flatten_config(item)
+    elif value is not None:
+        yield str(value)
+
+def extract_terms(config):
+    """Extract the (field, value) pairs used by the structured filters"""
+    terms = set()
+    for config_key, field in CONCEPT_FIELDS.items():
+        terms.update((field, normalize_term(code)) for code in config.get(config_key) or [])
+
+    # ICD-code and medication-name configurations
+    for role in ("exposure", "outcome"):
+        codes = config.get(role)
+        if isinstance(codes, dict):
+            for key in ("icd9", "icd10", "names"):
+                terms.update((f"{role}_concept", normalize_term(code)) for code in codes.get(key) or [])
+
+    for name, enabled in (config.get("confounders") or {}).items():
+        if enabled:
+            terms.add(("confounder", normalize_term(name)))
+    return terms
+
+def get_variable_type(config, role):
+    """Get the exposure/outcome type from either config layout"""
+    if config.get(f"{role}_type"):
+        return config[f"{role}_type"]
+    codes = config.get(role)
+    return codes.get("type") if isinstance(codes, dict) else None
+
+def index_analysis(db, analysis):
+    """Write (or rewrite) the search index entries for a flushed analysis"""
+    config = analysis.config or {}
+    search_text = " ".join([analysis.description or "", *flatten_config(config)])
+
+    db.merge(AnalysisSearch(
+        analysis_id=analysis.id,
+        exposure_type=get_variable_type(config, "exposure"),
+        outcome_type=get_variable_type(config, "outcome"),
+        search_text=search_text
+    ))
+    db.query(AnalysisTerm).filter(AnalysisTerm.analysis_id == analysis.id).delete()
+    db.add_all(
+        AnalysisTerm(analysis_id=analysis.id, field=field, value=value)
+        for field, value in extract_terms(config)
+    )
+
+    if db.get_bind().dialect.name == "sqlite":
+        db.execute(text("DELETE FROM analyses_fts WHERE rowid = :id"), {"id": analysis.id})
+        db.execute(
+            text("INSERT INTO analyses_fts(rowid, search_text) VALUES (:id, :search_text)"),
+            {"id": analysis.id, "search_text": search_text}
+        )
+
+def index_missing_analyses(db, batch_size=500):
+    """Backfill the search index for analyses saved before it existed"""
+    missing = (
+        db.query(Analysis)
+        .outerjoin(AnalysisSearch, AnalysisSearch.analysis_id == Analysis.id)
+        .filter(AnalysisSearch.analysis_id.is_(None))
+        .yield_per(batch_size)
+    )
+    count = 0
+    for analysis in missing:
+        index_analysis(db, analysis)
+        count += 1
+    db.commit()
+    if count:
+        logger.info(f"Indexed {count} existing analyses for search")
+    return count
+
+def fts5_query(query_text):
+    """Quote each word so user input cannot inject FTS5 syntax, matching every word as a prefix"""
+    return " ".join('"' + token.replace('"', '""') + '"*' for token in query_text.split())
+
+def search_analyses(db, query_text=None, exposure_concept=None, outcome_concept=None,
+                    exposure_type=None, outcome_type=None, confounders=(), limit=50):
+    """Search saved analyses by description/config text and structured config fields, newest first"""
+    query = db.query(Analysis).join(AnalysisSearch, AnalysisSearch.analysis_id == Analysis.id)
+
+    if query_text and query_text.strip():
+        dialect = db.get_bind().dialect.name
+        if dialect == "sqlite":
+            matches = (
+                text("SELECT rowid FROM analyses_fts WHERE analyses_fts MATCH :match")
+                .bindparams(match=fts5_query(query_text))
+                .columns(rowid=Integer)
+            )
+            query = query.filter(Analysis.id.in_(matches))
+        elif dialect == "postgresql":
+            # Must match the expression of ix_analysis_search_fts for the GIN index to be used
+            document = func.to_tsvector(literal_column("'english'"), func.coalesce(AnalysisSearch.search_text, ""))
+            query = query.filter(document.op("@@")(func.plainto_tsquery(literal_column("'english'"), query_text)))
+        else:
+            query = query.filter(AnalysisSearch.search_text.ilike(f"%{query_text.strip()}%"))
+
+    def has_term(field, value):
+        return Analysis.id.in_(
+            select(AnalysisTerm.analysis_id)
+            .where(AnalysisTerm.field == field, AnalysisTerm.value == normalize_term(value))
+        )
+
+    if exposure_concept:
+        query = query.filter(has_term("exposure_concept", exposure_concept))
+    if outcome_concept:
+        query = query.filter(has_term("outcome_concept", outcome_concept))
+    for confounder in confounders:
+        query = query.filter(has_term("confounder", confounder))
+    if exposure_type:
+        query = query.filter(AnalysisSearch.exposure_type == exposure_type)
+    if outcome_type:
+        query = query.filter(AnalysisSearch.outcome_type == outcome_type)
+
+    return query.order_by(Analysis.id.desc()).limit(limit).all()
@@ -0,0 +1,360 @@
+"""Headless HTTP/JSON service for code generation.
+
+Run with: python -m utils.service --port 8000 --workers 16
+"""
+import argparse
+import json
+import logging
+import queue
+import selectors
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from utils.code_templates import generate_python_code, generate_r_code
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+VARIABLE_TYPES = ("condition", "medication", "procedure")
+CONFOUNDER_NAMES = ("age", "sex", "race_ethnicity", "insurance", "income", "education", "smoking")
+# Boolean options and their defaults, matching the app form
+FLAG_DEFAULTS = {
+    "include_visualization": True,
+    "include_advanced_stats": True,
+    "include_python_analysis": False,
+}
+MAX_BODY_BYTES = 1024 * 1024
+
+class ConfigError(ValueError):
+    """Raised when a request config does not match the expected schema"""
+
+    def __init__(self, errors, status=400):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+        self.status = status
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def validate_config(config):
+    """Validate a config against the schema the templates expect and fill in defaults"""
+    if not isinstance(config, dict):
+        raise ConfigError(["config must be a JSON object"])
+    errors = []
+
+    def concept_list(key, required):
+        value = config.get(key) or []
+        if not isinstance(value, list) or not all(is_int(code) for code in value):
+            errors.append(f"{key} must be a list of integer concept IDs")
+            return []
+        if required and not value:
+            errors.append(f"{key} must contain at least one concept ID")
+        return value
+
+    def variable_type(key, required):
+        value = config.get(key)
+        if value is None and not required:
+            return None
+        if value not in VARIABLE_TYPES:
+            errors.append(f"{key} must be one of: {', '.join(VARIABLE_TYPES)}")
+        return value
+
+    normalized = {
+        "exposure_var": concept_list("exposure_var", True),
+        "exposure_type": variable_type("exposure_type", True),
+        "outcome_var": concept_list("outcome_var", True),
+        "outcome_type": variable_type("outcome_type", True),
+        "exclusion_var": concept_list("exclusion_var", False),
+        "exclusion_type": variable_type("exclusion_type", False),
+    }
+    if normalized["exclusion_var"] and not normalized["exclusion_type"]:
+        errors.append("exclusion_type is required when exclusion_var is set")
+
+    confounders = config.get("confounders", {})
+    if not isinstance(confounders, dict):
+        errors.append("confounders must be an object")
+        confounders = {}
+    for name, enabled in confounders.items():
+        if name not in CONFOUNDER_NAMES:
+            errors.append(f"unknown confounder: {name}")
+        elif not isinstance(enabled, bool):
+            errors.append(f"confounders.{name} must be true or false")
+    normalized["confounders"] = {name: confounders.get(name, True) is True for name in CONFOUNDER_NAMES}
+
+    for flag, default in FLAG_DEFAULTS.items():
+        value = config.get(flag, default)
+        if not isinstance(value, bool):
+            errors.append(f"{flag} must be true or false")
+        normalized[flag] = value is True
+
+    normalized["temporal"] = validate_temporal(config.get("temporal"), errors)
+
+    sample_fraction = config.get("sample_fraction")
+    if sample_fraction is not None and (
+        isinstance(sample_fraction, bool) or not isinstance(sample_fraction, (int, float))
+        or not 0 < sample_fraction <= 1
+    ):
+        errors.append("sample_fraction must be a number in (0, 1] or null")
+    sample_seed = config.get("sample_seed", 0)
+    if not is_int(sample_seed):
+        errors.append("sample_seed must be an integer")
+    normalized["sample_fraction"] = sample_fraction
+    # The seed only matters when sampling, so full runs share one cache entry
+    normalized["sample_seed"] = sample_seed if sample_fraction is not None else 0
+
+    unknown = set(config) - set(normalized)
+    if unknown:
+        errors.append(f"unknown config fields: {', '.join(sorted(unknown))}")
+    if errors:
+        raise ConfigError(errors)
+    return normalized
+
+def validate_temporal(temporal, errors):
+    """Validate the optional temporal cohort settings"""
+    if temporal is None:
+        return None
+    if not isinstance(temporal, dict):
+        errors.append("temporal must be an object or null")
+        return None
+
+    index_date = temporal.get("index_date", "first_exposure")
+    if index_date != "first_exposure":
+        try:
+            index_date = date.fromisoformat(index_date).isoformat()
+        except (TypeError, ValueError):
+            errors.append("temporal.index_date must be 'first_exposure' or a YYYY-MM-DD date")
+    washout_days = temporal.get("washout_days", 0)
+    if not is_int(washout_days) or washout_days < 0:
+        errors.append("temporal.washout_days must be a non-negative integer")
+    outcome_window_days = temporal.get("outcome_window_days")
+    if outcome_window_days is not None and (not is_int(outcome_window_days) or outcome_window_days <= 0):
+        errors.append("temporal.outcome_window_days must be a positive integer or null")
+
+    unknown = set(temporal) - {"index_date", "washout_days", "outcome_window_days"}
+    if unknown:
+        errors.append(f"unknown temporal fields: {', '.join(sorted(unknown))}")
+    return {
+        "index_date": index_date,
+        "washout_days": washout_days,
+        "outcome_window_days": outcome_window_days,
+    }
+
+def config_key(config):
+    """Canonical JSON form of a validated config, used as the cache key"""
+    return json.dumps(config, sort_keys=True, separators=(",", ":"))
+
+class CodeGenerationHandler(BaseHTTPRequestHandler):
+    """JSON endpoints: GET /health, POST /generate and POST /analyses"""
+    protocol_version = "HTTP/1.1"
+    # Give up on a client that stalls partway through sending a request after this many seconds
+    timeout = 30
+    # Headers and body are separate writes; avoid Nagle/delayed-ACK stalls between them
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        """Serve a single request; the server waits for the next one on keep-alive connections"""
+        self.handle_one_request()
+
+    def finish(self):
+        # The streams stay open while a keep-alive connection waits for its next request
+        if self.close_connection:
+            super().finish()
+
+    def has_pending_request(self):
+        """Whether the next request's bytes are already buffered or readable without blocking"""
+        self.connection.setblocking(False)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def send_json(self, status, body):
+        payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def read_json(self):
+        header = self.headers.get("Content-Length")
+        if header is None:
+            self.close_connection = True
+            raise ConfigError(["Content-Length header is required"], status=411)
+        # Digits only: int() would also accept signs and underscores
+        if not header.strip().isdecimal():
+            self.close_connection = True
+            raise ConfigError(["Content-Length must be a non-negative integer"])
+        length = int(header)
+        if length > MAX_BODY_BYTES:
+            # The unread body would otherwise be parsed as the next request
+            self.close_connection = True
+            raise ConfigError([f"request body exceeds {MAX_BODY_BYTES} bytes"], status=413)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            raise ConfigError([f"invalid JSON: {e}"])
+        if not isinstance(body, dict):
+            raise ConfigError(["request body must be a JSON object"])
+        return body
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok"})
+        else:
+            self.send_json(404, {"error": f"unknown path: {self.path}"})
+
+    def do_POST(self):
+        try:
+            if self.path == "/generate":
+                body = self.read_json()
+                config = validate_config(body.get("config"))
+                self.send_json(200, self.server.generate_response(config_key(config)))
+            elif self.path == "/analyses":
+                body = self.read_json()
+                config = validate_config(body.get("config"))
+                description = body.get("description") or ""
+                if not isinstance(description, str):
+                    raise ConfigError(["description must be a string"])
+                code = json.loads(self.server.generate_response(config_key(config)))
+                # Imported on first save so serving /generate never loads the database stack
+                from utils.analyses import create_analysis
+                analysis_id = create_analysis(config, code["python_code"], code["r_code"], description)
+                self.send_json(201, {"id": analysis_id, **code})
+            else:
+                self.send_json(404, {"error": f"unknown path: {self.path}"})
+        except ConfigError as e:
+            self.send_json(e.status, {"error": "invalid request", "details": e.errors})
+        except Exception as e:
+            logger.error(f"Failed to handle {self.path}: {e}")
+            self.send_json(500, {"error": "internal server error"})
+
+class CodeGenerationServer(HTTPServer):
+    """HTTP server that runs requests on a bounded worker pool with a response cache
+
+    A worker handles one request at a time. Between requests, keep-alive
+    connections wait in a selector on a single thread, so idle clients never
+    hold a worker.
+    """
+    request_queue_size = 128
+    # Close keep-alive connections that send nothing for this many seconds
+    idle_timeout = 30
+
+    def __init__(self, address, workers=16, cache_size=256):
+        super().__init__(address, CodeGenerationHandler)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="codegen")
+        self.generate_response = lru_cache(maxsize=cache_size)(self.render_code)
+        self.idle_selector = selectors.DefaultSelector()
+        # Workers queue connections here and write to the wakeup socket; only the idle thread touches the selector
+        self.parked = queue.SimpleQueue()
+        self.wakeup_recv, self.wakeup_send = socket.socketpair()
+        self.idle_selector.register(self.wakeup_recv, selectors.EVENT_READ)
+        self.closing = False
+        self.idle_thread = threading.Thread(target=self.watch_idle_connections, name="codegen-idle", daemon=True)
+        self.idle_thread.start()
+
+    @staticmethod
+    def render_code(key):
+        """Generate both scripts for a canonical config and serialize the response body"""
+        config = json.loads(key)
+        return json.dumps({
+            "python_code": generate_python_code(config),
+            "r_code": generate_r_code(config),
+        }).encode()
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_worker, request, client_address)
+
+    def process_request_worker(self, request, client_address, handler=None):
+        """Handle the next request on a connection, then park or close it"""
+        try:
+            if handler is None:
+                handler = self.RequestHandlerClass(request, client_address, self)
+            else:
+                handler.handle()
+                handler.finish()
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+            return
+
+        if handler.close_connection:
+            self.shutdown_request(request)
+        elif handler.has_pending_request() and not self.closing:
+            self.pool.submit(self.process_request_worker, request, client_address, handler)
+        else:
+            self.parked.put(handler)
+            self.wakeup_send.send(b"\0")
+
+    def watch_idle_connections(self):
+        """Hand keep-alive connections back to the pool once their next request arrives"""
+        while not self.closing:
+            while not self.parked.empty():
+                handler = self.parked.get()
+                handler.idle_since = time.monotonic()
+                self.idle_selector.register(handler.connection, selectors.EVENT_READ, handler)
+
+            for key, _ in self.idle_selector.select(timeout=1):
+                if key.fileobj is self.wakeup_recv:
+                    self.wakeup_recv.recv(4096)
+                elif not self.closing:
+                    self.idle_selector.unregister(key.fileobj)
+                    self.pool.submit(self.process_request_worker, key.fileobj, key.data.client_address, key.data)
+
+            expired = time.monotonic() - self.idle_timeout
+            for key in list(self.idle_selector.get_map().values()):
+                if key.data is not None and key.data.idle_since < expired:
+                    self.idle_selector.unregister(key.fileobj)
+                    self.close_parked(key.data)
+
+    def close_parked(self, handler):
+        handler.close_connection = True
+        handler.finish()
+        self.shutdown_request(handler.connection)
+
+    def server_close(self):
+        super().server_close()
+        self.closing = True
+        self.wakeup_send.send(b"\0")
+        self.idle_thread.join()
+        self.pool.shutdown(wait=True)
+        for key in list(self.idle_selector.get_map().values()):
+            if key.data is not None:
+                self.close_parked(key.data)
+        while not self.parked.empty():
+            self.close_parked(self.parked.get())
+        self.idle_selector.close()
+        self.wakeup_recv.close()
+        self.wakeup_send.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve code generation over HTTP/JSON")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=16, help="requests handled concurrently")
+    parser.add_argument("--cache-size", type=int, default=256, help="generated responses kept in memory")
+    args = parser.parse_args()
+
+    server = CodeGenerationServer((args.host, args.port), workers=args.workers, cache_size=args.cache_size)
+    logger.info(f"Serving code generation on {args.host}:{args.port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()